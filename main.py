@@ -1,30 +1,124 @@
 import os
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlencode
+import orjson
+import uvicorn
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from typing import List, Optional
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from typing import List
 from pydantic import BaseModel
 
+from bson import ObjectId
+
 from database import db, create_document, get_documents
 from schemas import CVProfile
 
-from xhtml2pdf import pisa
-from io import BytesIO
+from markupsafe import Markup
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="MakeMeHired.com API", version="1.0", default_response_class=ORJSONResponse)
+
+# PDF rendering is CPU-bound and holds the GIL, so it runs in worker processes
+_PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+_pdf_pool = ProcessPoolExecutor(max_workers=_PDF_WORKERS)
 
-app = FastAPI(title="MakeMeHired.com API", version="1.0")
+# FRONTEND_ORIGIN is a comma-separated list; fall back to any origin (without credentials) if unset
+_frontend_origins = [o.strip() for o in os.getenv("FRONTEND_ORIGIN", "").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=_frontend_origins or ["*"],
+    allow_credentials=bool(_frontend_origins),
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["content-type", "authorization"],
 )
 
 
+class _SkipPDFGZipMiddleware(GZipMiddleware):
+    # WeasyPrint already compresses its streams, so gzipping the PDF routes only burns CPU
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/pdf"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# The CV HTML in /api/cv/generate compresses well; tiny responses aren't worth it
+app.add_middleware(_SkipPDFGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+_WARMUP_HTML = "<html><body>x</body></html>"
+
+
+@app.on_event("startup")
+async def _warmup_pdf_pool():
+    # Start every pool process and pay WeasyPrint's lazy imports/font setup before the first request
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(_pdf_pool, html_to_pdf_bytes, _WARMUP_HTML) for _ in range(_PDF_WORKERS)
+    ))
+
+
+@app.on_event("shutdown")
+def _shutdown_pdf_pool():
+    _pdf_pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Constant payloads are serialized once at import
+_ROOT_JSON = orjson.dumps({"message": "MakeMeHired Backend Running"})
+_TEMPLATES_JSON = orjson.dumps({
+    "templates": [
+        {"id": "modern", "name": "Modern"},
+        {"id": "minimal", "name": "Minimal"},
+        {"id": "classic", "name": "Classic"}
+    ]
+})
+
+
+def _static_headers(content: bytes) -> dict:
+    # Let reverse proxies and CDNs serve these without reaching the app
+    return {
+        "Cache-Control": "public, max-age=3600, immutable",
+        # Weak tag, since GZipMiddleware may serve a different encoding of the same body
+        "ETag": f'W/"{hashlib.md5(content, usedforsecurity=False).hexdigest()}"',
+    }
+
+
+_ROOT_HEADERS = _static_headers(_ROOT_JSON)
+_TEMPLATES_HEADERS = _static_headers(_TEMPLATES_JSON)
+
+
 @app.get("/")
 def read_root():
-    return {"message": "MakeMeHired Backend Running"}
+    return Response(content=_ROOT_JSON, media_type="application/json", headers=_ROOT_HEADERS)
+
+
+# /test is polled by monitoring, so the collection listing is reused for a short while
+_DB_PROBE_TTL = 30.0
+_db_probe_cache = None
+
+
+def _probe_db() -> List[str]:
+    global _db_probe_cache
+    now = time.monotonic()
+    if _db_probe_cache is not None and _db_probe_cache[0] > now:
+        return _db_probe_cache[1]
+    collections = db.list_collection_names()[:10]
+    _db_probe_cache = (now + _DB_PROBE_TTL, collections)
+    return collections
 
 
 @app.get("/test")
@@ -46,8 +140,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                response["collections"] = _probe_db()
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -66,150 +159,157 @@ def test_database():
 
 # ---------- CV Generation Helpers ----------
 
-def skills_to_keywords(skills: List[str]) -> List[str]:
-    return [s.strip() for s in skills if s and isinstance(s, str)]
-
-
-def render_cv_html(data: CVProfile) -> str:
-    # Safe formatting for ATS: one column, headings, bullet lists
-    def bullet_list(items: Optional[List[str]]) -> str:
-        if not items:
-            return ""
-        lis = "".join([f"<li>{p}</li>" for p in items if p])
-        return f"<ul>{lis}</ul>"
-
-    # Experience
-    exp_html = ""
-    for e in data.experience:
-        ach_html = bullet_list(e.achievements)
-        exp_html += f"""
-        <div class='exp-item'>
-            <div class='exp-header'><strong>{e.role}</strong> | {e.company} — <span class='muted'>{e.duration}</span></div>
-            {ach_html}
-        </div>
-        """
-
-    # Education
-    edu_html = ""
-    for ed in data.education:
-        edu_html += f"<div class='edu-item'><strong>{ed.degree}</strong>, {ed.institution} — <span class='muted'>{ed.year}</span></div>"
-
-    certs_html = bullet_list(data.certifications)
-    projects_html = bullet_list(data.projects)
-    languages_html = bullet_list(data.languages)
-    interests_html = bullet_list(data.interests)
-
-    skills_html = "".join([f"<span class='tag'>{s}</span>" for s in skills_to_keywords(data.skills)])
-
-    html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-<meta charset='utf-8'>
-<title>{data.full_name} — {data.job_title_target} CV</title>
-<style>
-  @page {{ size: A4; margin: 20mm; }}
-  body {{ font-family: Arial, Helvetica, sans-serif; color: #111; font-size: 11pt; }}
-  .header {{ border-bottom: 2px solid #111; padding-bottom: 6px; margin-bottom: 10px; }}
-  .name {{ font-size: 20pt; font-weight: bold; }}
-  .contact {{ font-size: 10pt; color: #333; }}
-  h2 {{ font-size: 12.5pt; margin: 14px 0 6px; padding: 0; }}
-  .section {{ margin-bottom: 8px; }}
-  .muted {{ color: #555; }}
-  ul {{ margin: 4px 0 0 18px; }}
-  li {{ line-height: 1.35; margin: 2px 0; }}
-  .tag {{ display: inline-block; border: 1px solid #999; padding: 2px 6px; border-radius: 3px; margin: 2px 6px 0 0; font-size: 9pt; }}
-  .exp-item, .edu-item {{ margin-bottom: 6px; }}
-</style>
-</head>
-<body>
-  <div class='header'>
-    <div class='name'>{data.full_name}</div>
-    <div class='contact'>
-      {data.phone} • {data.email}{' • ' + data.linkedin if data.linkedin else ''}
-    </div>
-  </div>
-
-  <div class='section'>
-    <h2>Professional Summary</h2>
-    <p>{data.summary or f"Results-driven {data.job_title_target} with experience across key areas and strong focus on measurable impact."}</p>
-  </div>
-
-  <div class='section'>
-    <h2>Core Skills</h2>
-    <div>{skills_html}</div>
-  </div>
-
-  <div class='section'>
-    <h2>Professional Experience</h2>
-    {exp_html}
-  </div>
-
-  <div class='section'>
-    <h2>Education</h2>
-    {edu_html}
-  </div>
-
-  {f"<div class='section'><h2>Certifications</h2>{certs_html}</div>" if certs_html else ''}
-  {f"<div class='section'><h2>Projects / Achievements</h2>{projects_html}</div>" if projects_html else ''}
-  {f"<div class='section'><h2>Languages</h2>{languages_html}</div>" if languages_html else ''}
-  {f"<div class='section'><h2>Interests</h2>{interests_html}</div>" if interests_html else ''}
-
-</body>
-</html>
-"""
-    return html
+# Module-level environment so the compiled template is cached across requests;
+# user fields are HTML-escaped (markupsafe) so they can't inject markup
+_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+_jinja_env = Environment(
+    loader=FileSystemLoader(_TEMPLATE_DIR),
+    autoescape=select_autoescape(["html", "html.j2"]),
+    auto_reload=False,
+)
+_CV_TEMPLATE = _jinja_env.get_template("cv_template.html.j2")
+
+# The stylesheet is parsed once per process and handed to WeasyPrint directly;
+# it is only inlined into the HTML returned to clients for previewing
+with open(os.path.join(_TEMPLATE_DIR, "cv_style.css"), encoding="utf-8") as _f:
+    _CV_CSS_STRING = _f.read()
+_FONT_CONFIG = FontConfiguration()
+_CV_CSS = CSS(string=_CV_CSS_STRING, font_config=_FONT_CONFIG)
+
+
+def render_cv_html(data: CVProfile, inline_css: bool = True) -> str:
+    # Plain dicts are cheaper for the template to walk than the nested models
+    ctx = data.model_dump()
+    stylesheet = Markup(_CV_CSS_STRING) if inline_css else None
+    return _CV_TEMPLATE.render(data=ctx, stylesheet=stylesheet)
 
 
 def html_to_pdf_bytes(html: str) -> bytes:
-    # Convert HTML to PDF (A4) using xhtml2pdf
-    pdf_io = BytesIO()
-    pisa.CreatePDF(src=html, dest=pdf_io)
-    pdf_io.seek(0)
-    return pdf_io.read()
+    # Convert HTML to PDF (A4) using WeasyPrint with the pre-parsed stylesheet
+    return HTML(string=html).write_pdf(stylesheets=[_CV_CSS], font_config=_FONT_CONFIG)
+
+
+# Spaces are dropped and path/header-unsafe characters replaced in a single pass
+_SAFE_TABLE = str.maketrans({" ": None, **{c: "_" for c in "/\\:*?\"<>|\n\r\t"}})
+
+
+def cv_filename(profile: CVProfile) -> str:
+    return f"{profile.full_name.translate(_SAFE_TABLE)}_{profile.job_title_target.translate(_SAFE_TABLE)}_MakeMeHiredCV.pdf"
+
+
+# Rendered PDFs keyed by a hash of the profile, so repeated previews skip the renderer
+_PDF_CACHE_SIZE = int(os.getenv("PDF_CACHE_SIZE", 256))
+_pdf_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+
+
+def profile_cache_key(profile: CVProfile) -> bytes:
+    # Sorted keys give a canonical byte form regardless of field order
+    key_bytes = orjson.dumps(profile.model_dump(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(key_bytes, digest_size=16).digest()
+
+
+async def render_cv_pdf(profile: CVProfile) -> bytes:
+    key = profile_cache_key(profile)
+    pdf_bytes = _pdf_cache.get(key)
+    if pdf_bytes is not None:
+        _pdf_cache.move_to_end(key)
+        return pdf_bytes
+
+    pdf_html = render_cv_html(profile, inline_css=False)
+    loop = asyncio.get_running_loop()
+    pdf_bytes = await loop.run_in_executor(_pdf_pool, html_to_pdf_bytes, pdf_html)
+
+    _pdf_cache[key] = pdf_bytes
+    if len(_pdf_cache) > _PDF_CACHE_SIZE:
+        _pdf_cache.popitem(last=False)
+    return pdf_bytes
+
+
+async def pdf_response(profile: CVProfile) -> Response:
+    # Send the PDF as raw bytes; base64 in JSON costs ~1.33x the size plus an encode/decode
+    pdf_bytes = await render_cv_pdf(profile)
+    filename = cv_filename(profile)
+    # Plain ASCII filename for clients without RFC 5987 support, UTF-8 one for the rest
+    ascii_filename = filename.encode("ascii", "replace").decode("ascii").replace("?", "_")
+    return Response(
+        content=pdf_bytes,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename=\"{ascii_filename}\"; filename*=UTF-8''{quote(filename)}",
+        },
+    )
+
+
+# Stored-CV PDF links are HMAC-signed and expire; no links are issued without CV_URL_SECRET
+_CV_URL_SECRET = os.getenv("CV_URL_SECRET", "").encode()
+_CV_URL_TTL = int(os.getenv("CV_URL_TTL", 3600))
+
+
+def _pdf_url_signature(cv_id: str, exp: int) -> str:
+    return hmac.new(_CV_URL_SECRET, f"{cv_id}:{exp}".encode(), hashlib.sha256).hexdigest()
+
+
+def signed_pdf_url(cv_id: str) -> str:
+    exp = int(time.time()) + _CV_URL_TTL
+    query = urlencode({"exp": exp, "sig": _pdf_url_signature(cv_id, exp)})
+    return f"{app.url_path_for('get_cv_pdf', cv_id=cv_id)}?{query}"
 
 
 # ---------- API Endpoints ----------
 
 @app.post("/api/cv/generate")
-def generate_cv(profile: CVProfile):
-    """Accept user input and return HTML + PDF bytes (base64) and a storage id."""
-    # Persist to DB
+async def generate_cv(profile: CVProfile):
+    """Accept user input and return the CV HTML, a storage id and the URL of its PDF."""
+    # Persist to DB (PyMongo is blocking, keep it off the event loop)
     try:
-        doc_id = create_document("cvprofile", profile)
+        doc_id = await run_in_threadpool(create_document, "cvprofile", profile)
     except Exception as e:
         # Proceed even if DB not configured, but note error
         doc_id = None
 
     html = render_cv_html(profile)
-    pdf_bytes = html_to_pdf_bytes(html)
-
-    # Encode PDF for transfer
-    import base64
-    pdf_b64 = base64.b64encode(pdf_bytes).decode("utf-8")
-
-    filename = f"{profile.full_name.replace(' ', '')}_{profile.job_title_target.replace(' ', '')}_MakeMeHiredCV.pdf"
 
     return {
         "id": doc_id,
-        "filename": filename,
+        "filename": cv_filename(profile),
         "html": html,
-        "pdf_base64": pdf_b64,
+        "pdf_url": signed_pdf_url(doc_id) if doc_id and _CV_URL_SECRET else None,
     }
 
 
+@app.get("/api/cv/{cv_id}/pdf")
+async def get_cv_pdf(cv_id: str, exp: int = 0, sig: str = ""):
+    """Render a stored CV profile as a PDF download from a signed pdf_url."""
+    if (
+        not _CV_URL_SECRET
+        or exp < time.time()
+        or not hmac.compare_digest(sig.encode(), _pdf_url_signature(cv_id, exp).encode())
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    if not ObjectId.is_valid(cv_id):
+        raise HTTPException(status_code=404, detail="CV not found")
+    try:
+        docs = await run_in_threadpool(get_documents, "cvprofile", {"_id": ObjectId(cv_id)}, 1)
+    except Exception:
+        logger.exception("Failed to load CV %s", cv_id)
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    if not docs:
+        raise HTTPException(status_code=404, detail="CV not found")
+
+    return await pdf_response(CVProfile.model_validate(docs[0]))
+
+
+@app.post("/api/cv/pdf")
+async def generate_cv_pdf(profile: CVProfile):
+    """Render a CV PDF directly from user input without storing it."""
+    return await pdf_response(profile)
+
+
 @app.get("/api/cv/templates")
 def get_templates():
-    return {
-        "templates": [
-            {"id": "modern", "name": "Modern"},
-            {"id": "minimal", "name": "Minimal"},
-            {"id": "classic", "name": "Classic"}
-        ]
-    }
+    return Response(content=_TEMPLATES_JSON, media_type="application/json", headers=_TEMPLATES_HEADERS)
 
 
 if __name__ == "__main__":
-    import uvicorn
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -2,9 +2,9 @@
 echo "Starting FastAPI backend server..."
 
 # Find and kill MainThread processes
-PIDS=$(ps | grep uvicorn | grep -v grep | awk '{print $1}')
+PIDS=$(ps | grep -E "uvicorn|gunicorn" | grep -v grep | awk '{print $1}')
 if [ ! -z "$PIDS" ]; then
-  echo "Killing uvicorn processes: $PIDS"
+  echo "Killing server processes: $PIDS"
   for pid in $PIDS; do
     kill $pid 2>/dev/null || true
   done
@@ -15,5 +15,9 @@ mkdir -p logs
 echo "Installing dependencies..."
 pip install -r requirements.txt
 echo "Starting FastAPI server..."
-nohup uvicorn main:app --host 0.0.0.0 --port 8000 --reload > logs/server.log 2>&1 
+# One event loop per worker process; split the cores between each worker's PDF pool
+WORKERS=${WORKERS:-$(nproc)}
+export PDF_WORKERS=${PDF_WORKERS:-$(( $(nproc) / WORKERS > 0 ? $(nproc) / WORKERS : 1 ))}
+nohup gunicorn main:app -k uvicorn.workers.UvicornWorker -w $WORKERS \
+  --bind 0.0.0.0:${PORT:-8000} --worker-tmp-dir /dev/shm > logs/server.log 2>&1 
 echo "Server started in background"